@@ -3,9 +3,11 @@
 """
 
 import argparse
+import importlib.util
 import json
 import os
 import sys
+from functools import lru_cache
 from pathlib import Path
 
 from . import __version__
@@ -13,12 +15,13 @@ from .litematicadecoder import Resolve
 from .objbuilder import LitimaticaToObj
 from .texturepackexport import TextureCacheBuilder
 
-SCHEMATIC_EXTENSIONS = {".litematic", ".litematica", ".schematic", ".schem"}
+SCHEMATIC_EXTENSIONS = (".litematic", ".litematica", ".schematic", ".schem")
 
 
+@lru_cache(maxsize=256)
 def is_schematic_file(filepath: str) -> bool:
     """Check if the file is a schematic file based on its extension."""
-    return Path(filepath).suffix.lower() in SCHEMATIC_EXTENSIONS
+    return filepath.lower().endswith(SCHEMATIC_EXTENSIONS)
 
 
 def main() -> None:
@@ -44,7 +47,7 @@ def main() -> None:
         "-i",
         "--input",
         required=True,
-        help="Input schematic file (.litematic, .litematica, .schematic, .schem).",
+        help=f"Input schematic file ({', '.join(SCHEMATIC_EXTENSIONS)}).",
     )
 
     parser.add_argument(
@@ -61,6 +64,12 @@ def main() -> None:
         help="Resource pack ZIP file(s). Required for OBJ output. Left-most takes precedence.",
     )
 
+    parser.add_argument(
+        "--atlas",
+        action="store_true",
+        help="Pack block textures into a single texture atlas (OBJ output only, requires Pillow).",
+    )
+
     args = parser.parse_args()
 
     # Validate input file
@@ -82,6 +91,14 @@ def main() -> None:
         print("Error: Output file must have .json or .obj extension.", file=sys.stderr)
         sys.exit(1)
 
+    if args.atlas:
+        if output_ext != ".obj":
+            print("Error: --atlas is only supported for OBJ output.", file=sys.stderr)
+            sys.exit(1)
+        if importlib.util.find_spec("PIL") is None:
+            print("Error: --atlas requires Pillow (pip install Pillow).", file=sys.stderr)
+            sys.exit(1)
+
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
     try:
@@ -117,13 +134,17 @@ def main() -> None:
                     sys.exit(1)
                 texture_packs.append(tp_path)
 
-            # Collect unique block names from schematic
-            block_names: set[str] = set()
-            for region in schematic_data["Regions"].values():
-                for block in region["decode_BlockStates"]:
-                    name = block["Name"].replace("minecraft:", "")
-                    if name != "air":
-                        block_names.add(name)
+            # Collect unique block names from each region's palette, which lists every
+            # block type once, instead of scanning every decoded block
+            raw_names = {
+                entry["Name"]
+                for region in schematic_data["Regions"].values()
+                for entry in region["BlockStatePalette"]
+            }
+            block_names: set[str] = {
+                name[10:] if name.startswith("minecraft:") else name for name in raw_names
+            }
+            block_names.discard("air")
 
             if args.verbose:
                 print(f"Found {len(block_names)} unique block types")
@@ -136,7 +157,11 @@ def main() -> None:
                 )
 
             TextureCacheBuilder(
-                block_names, texture_packs, cache_dir, show_progress=args.verbose
+                block_names,
+                texture_packs,
+                cache_dir,
+                show_progress=args.verbose,
+                atlas=args.atlas,
             )
 
             # Step 3: Build 3D model
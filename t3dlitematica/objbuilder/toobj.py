@@ -10,6 +10,11 @@ import shutil
 from pathlib import Path
 from alive_progress import alive_bar
 
+try:
+    import orjson
+except ImportError:  # Optional speedup, fall back to the stdlib parser
+    orjson = None
+
 def LitimaticaToObj(litematica: dict, TextureFolder: str, output: str = "./", show_progress: bool = False) -> None:
     size = (
         int(litematica["Metadata"]["EnclosingSize"]["x"]),
@@ -36,6 +41,7 @@ class Objhandel:
         self.TextureFolder = TextureFolder
         self.outputfolder = outputfolder
         self._texture_data = self._load_texture_data()
+        self._atlas_index = self._load_atlas_index()
         self._block_cache = {}
         self.main(data, size)
         shutil.make_archive(os.path.join(self.outputfolder, self.name), "zip", self.tempfolder)
@@ -54,9 +60,27 @@ class Objhandel:
             cache_json = os.path.join(self.TextureFolder, "output.json")
         else:
             raise FileNotFoundError(f"No texture data found in {self.TextureFolder}")
+        if orjson is not None:
+            with open(cache_json, "rb") as f:
+                return orjson.loads(f.read())
         with open(cache_json, "r", encoding="utf8") as f:
             return json.load(f)
 
+    def _load_atlas_index(self) -> dict:
+        """Load the texture atlas UV index, if the cache was built with an atlas."""
+        atlas_index = os.path.join(self.TextureFolder, "atlas_index.json")
+        if not os.path.isfile(atlas_index):
+            return {}
+        with open(atlas_index, "r", encoding="utf8") as f:
+            return json.load(f)
+
+    def _face_texture(self, block: dict, index: int):
+        """Return the texture ref of a block's index-th face, or None if it has none."""
+        try:
+            return block["textures"][index]
+        except (KeyError, IndexError):
+            return None
+
     def _block_key(self, block_data: dict) -> tuple:
         """Create a hashable cache key from block data (Name + Properties)."""
         name = block_data["Name"]
@@ -218,6 +242,8 @@ class Objhandel:
                 for j in set(self.tmpdata[i]["textures"]):
                     if j not in self.textures:
                         self.textures.append(j)
+                        if j in self._atlas_index:
+                            continue  # Drawn from the shared atlas material
                         shutil.copy(
                             os.path.join(self.TextureFolder,"textures", j + ".png"),
                             os.path.join(self.tempfolder, "textures"),
@@ -226,6 +252,15 @@ class Objhandel:
                         temp += "Ka 1.000 1.000 1.000\n"
                         temp += "map_Kd " + os.path.join("textures", j.split("/")[-1] + ".png") + "\n"
                         temp += "\n"
+        if any(j in self._atlas_index for j in self.textures):
+            shutil.copy(
+                os.path.join(self.TextureFolder, "atlas.png"),
+                os.path.join(self.tempfolder, "textures", "atlas.png"),
+            )
+            temp += "newmtl " + "atlas" + "\n"
+            temp += "Ka 1.000 1.000 1.000\n"
+            temp += "map_Kd " + os.path.join("textures", "atlas.png") + "\n"
+            temp += "\n"
         temp += "newmtl " + "missing" + "\n"
         temp += "Ka 1.000 1.000 1.000\n"
         temp += (
@@ -245,7 +280,16 @@ class Objhandel:
                 if self.vtof.get((v[0], v[1], v[2])) == None:
                     oneblock += "v " + str(v[0]) + " " + str(v[1]) + " " + str(v[2]) + "\n"
                     self.vtof[(v[0], v[1], v[2])] = len(self.vtof) + 1
-            for vt in self.tmpdata[blocks]["vt"]:
+            face_vts = []
+            for ct1, vt in enumerate(self.tmpdata[blocks]["vt"]):
+                # Atlas textures: map the face's UVs into the texture's slot of the atlas
+                rect = self._atlas_index.get(self._face_texture(self.tmpdata[blocks], ct1))
+                if rect is not None:
+                    vt = [
+                        [rect[0] + i[0] * (rect[2] - rect[0]), rect[1] + i[1] * (rect[3] - rect[1])]
+                        for i in vt
+                    ]
+                face_vts.append(vt)
                 for i in vt:
                     if self.vtovt.get((i[0], i[1])) == None:
                         self.vtovt[(i[0], i[1])] = len(self.vtovt) + 1
@@ -253,15 +297,13 @@ class Objhandel:
 
             ct1 = 0
             for f in self.tmpdata[blocks]["f"]:
-                if "textures" in self.tmpdata[blocks]:
-                    try:
-                        oneblock += (
-                            "usemtl " + self.tmpdata[blocks]["textures"][ct1].split("/")[-1] + "\n"
-                        )
-                    except:
-                        oneblock += "usemtl " + "missing" + "\n"
-                else:
+                texture = self._face_texture(self.tmpdata[blocks], ct1)
+                if texture is None:
                     oneblock += "usemtl " + "missing" + "\n"
+                elif texture in self._atlas_index:
+                    oneblock += "usemtl " + "atlas" + "\n"
+                else:
+                    oneblock += "usemtl " + texture.split("/")[-1] + "\n"
                 oneblock += "f "
                 ct = 0
                 for i in f:
@@ -279,8 +321,8 @@ class Objhandel:
                         + str(
                             self.vtovt[
                                 (
-                                    self.tmpdata[blocks]["vt"][ct1][ct][0],
-                                    self.tmpdata[blocks]["vt"][ct1][ct][1],
+                                    face_vts[ct1][ct][0],
+                                    face_vts[ct1][ct][1],
                                 )
                             ]
                         )
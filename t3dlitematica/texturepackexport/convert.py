@@ -1,14 +1,82 @@
-import copy
+import hashlib
+import importlib.util
 import json
+import math
 import os
 import shutil
-import tempfile
+import threading
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Set, List, Optional
+from typing import Any, BinaryIO, Iterator
 
 from alive_progress import alive_bar
 
+from .. import __version__
+
+try:
+    import orjson
+except ImportError:  # Optional speedup, fall back to the stdlib parser
+    orjson = None
+
+# An asset inside a resource pack: the open archive and the member's entry
+_Asset = tuple[zipfile.ZipFile, zipfile.ZipInfo]
+
+# Asset categories under assets/minecraft/ that are indexed, with their file extension
+_ASSET_TYPES = {"blockstates": ".json", "models": ".json", "textures": ".png"}
+
+# Largest texture edge, in pixels, that is packed into the atlas
+_ATLAS_MAX_SIZE = 64
+
+# Layout version of the cache directory, hashed into its fingerprint. Bump it whenever
+# textures.json, atlas_index.json or the texture file layout change.
+_CACHE_FORMAT = 1
+
+# Textures smaller than this (most 16x16 block PNGs) are copied without hashing
+_DEDUP_MIN_SIZE = 4096
+
+
+def _loads(data: bytes) -> Any:
+    """Parse a JSON document from raw bytes, using orjson when available."""
+    data = data.removeprefix(b"\xef\xbb\xbf")  # Some packs ship UTF-8 BOMs
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _strip_mc(ref: str) -> str:
+    """Drop the "minecraft:" namespace from a resource reference."""
+    return ref[10:] if ref.startswith("minecraft:") else ref
+
+
+def _model_entries(blockstate: dict[str, Any]) -> list[dict[str, Any]]:
+    """List every {"model": ...} entry of a blockstate's variants and multipart cases."""
+    entries: list[dict[str, Any]] = []
+    for variant in blockstate.get("variants", {}).values():
+        if isinstance(variant, dict):
+            entries.append(variant)
+        elif isinstance(variant, list):
+            entries.extend(variant)
+    for part in blockstate.get("multipart", ()):
+        apply_data = part["apply"]
+        if isinstance(apply_data, dict):
+            entries.append(apply_data)
+        elif isinstance(apply_data, list):
+            entries.extend(apply_data)
+    return entries
+
+
+def _take_model_refs(blockstate: dict[str, Any]) -> set[str]:
+    """Collect all model references from a blockstate, shortening them in place."""
+    refs: set[str] = set()
+    for entry in _model_entries(blockstate):
+        model_ref: str = entry["model"]
+        refs.add(model_ref)
+        # Output keys models by short name ("block/oak_log" -> "oak_log")
+        entry["model"] = model_ref.rpartition("/")[2]
+    return refs
+
 
 class TextureCacheBuilder:
     """
@@ -17,143 +85,255 @@ class TextureCacheBuilder:
     Outputs:
     - <cache_dir>/textures.json: Combined blockstate + model data for needed blocks only
     - <cache_dir>/textures/: PNG texture files maintaining original directory structure
+    - <cache_dir>/.cache_fingerprint: Hash of the inputs the cache was built from
+
+    With `atlas=True`, block-sized textures (up to 64x64) are also packed into:
+    - <cache_dir>/atlas.png: A single RGBA texture atlas
+    - <cache_dir>/atlas_index.json: texture ref -> [u0, v0, u1, v1] of its slot, inset by
+      half a texel, in OBJ UV convention (origin at the bottom-left of atlas.png)
 
     When multiple resource packs are provided, left-most takes precedence.
+
+    If the cache directory was already built by the same version from the same block
+    names and unchanged resource packs, it is reused as-is: `result` and
+    `copied_textures` are then loaded back from it instead of being rebuilt.
     """
 
     def __init__(
         self,
-        block_names: Set[str],
-        resource_packs: List[str | Path],
+        block_names: set[str],
+        resource_packs: list[str | Path],
         cache_dir: str | Path,
         show_progress: bool = False,
+        atlas: bool = False,
     ):
         self.block_names = block_names
         self.resource_packs = [Path(p) for p in resource_packs]
         self.cache_dir = Path(cache_dir)
         self.show_progress = show_progress
-        self.result: dict = {"models": {}}
-        self.copied_textures: Set[str] = set()
-        self._extracted_packs: List[tuple[Path, Optional[str]]] = []
+        self.atlas = atlas
+        if atlas and importlib.util.find_spec("PIL") is None:
+            # Fail before any pack is opened rather than after resolving every block
+            raise ImportError("Pillow is required to build a texture atlas")
+        self.result: dict[str, Any] = {"models": {}}
+        self.copied_textures: set[str] = set()
+        # Blocks are resolved on worker threads: shared state is guarded by _lock, and
+        # models/textures are claimed before work starts so only one thread handles each
+        self._lock = threading.Lock()
+        self._claimed_models: set[str] = set()
+        self._claimed_textures: set[str] = set()
+        self._local = threading.local()  # Per-thread texture copy buffer
+        # Content digest -> first cache file written with those bytes, for hardlinking
+        self._hash_to_dest: dict[bytes, Path] = {}
+        # Texture directories known to exist; build() creates the top-level one
+        self._made_dirs: set[Path] = {self.cache_dir / "textures"}
+        self._packs: list[zipfile.ZipFile] = []  # Open archives, in priority order
+        # Asset name ("oak_log", "block/cube", "block/dirt") -> highest-priority pack entry
+        self._blockstates: dict[str, _Asset] = {}
+        self._models: dict[str, _Asset] = {}
+        self._textures: dict[str, _Asset] = {}
         self.build()
 
     def build(self) -> None:
-        """Build the texture cache: extract packs, resolve blocks, write output."""
+        """Build the texture cache: open packs, resolve blocks, write output."""
+        fingerprint = self._fingerprint()
+        fingerprint_file = self.cache_dir / ".cache_fingerprint"
+        if fingerprint is not None and self._load_cached(fingerprint_file, fingerprint):
+            return  # Same inputs as the existing cache
+
         if self.cache_dir.exists():
             shutil.rmtree(self.cache_dir)
         self.cache_dir.mkdir(parents=True)
         (self.cache_dir / "textures").mkdir()
 
+        if not self.block_names:
+            # Nothing to resolve, so don't even open the packs
+            self._write_result()
+        else:
+            try:
+                self._open_packs()
+                self._resolve_blocks()
+                self._write_result()
+            finally:
+                self._cleanup()
+            if self.atlas:
+                self._build_atlas()
+
+        # Only written once the cache is complete, so a failed build is never reused
+        if fingerprint is not None:
+            fingerprint_file.write_text(fingerprint, encoding="utf8")
+
+    def _load_cached(self, fingerprint_file: Path, fingerprint: str) -> bool:
+        """Load result and copied_textures from an existing cache built from the same inputs."""
         try:
-            self._extract_packs()
-            self._resolve_blocks()
-            with open(self.cache_dir / "textures.json", "w", encoding="utf8") as f:
-                json.dump(self.result, f, indent=4, ensure_ascii=False)
-        finally:
-            self._cleanup()
+            if fingerprint_file.read_text(encoding="utf8") != fingerprint:
+                return False
+            result = _loads((self.cache_dir / "textures.json").read_bytes())
+        except (OSError, ValueError):
+            return False  # Missing or unreadable cache, rebuild
+
+        textures_dir = self.cache_dir / "textures"
+        self.result = result
+        self.copied_textures = {
+            png.relative_to(textures_dir).with_suffix("").as_posix()
+            for png in textures_dir.rglob("*.png")
+        }
+        return True
 
-    def _extract_packs(self) -> None:
-        """Extract each resource pack ZIP to a temp directory."""
+    def _fingerprint(self) -> str | None:
+        """Hash the cache inputs and every pack's identity, or None if a pack is missing."""
+        h = hashlib.sha256(f"{_CACHE_FORMAT}|{__version__}|".encode())
+        h.update(json.dumps(sorted(self.block_names)).encode())
+        h.update(b"|atlas" if self.atlas else b"")
         for pack_path in self.resource_packs:
-            if pack_path.suffix == ".zip":
-                tmpdir = tempfile.mkdtemp()
-                with zipfile.ZipFile(pack_path, "r") as z:
-                    z.extractall(tmpdir)
-                mc_path = self._find_minecraft_path(tmpdir)
-                self._extracted_packs.append((mc_path, tmpdir))
-            else:
+            try:
+                st = pack_path.stat()
+            except OSError:
+                return None
+            h.update(f"|{pack_path.resolve()}:{st.st_mtime_ns}:{st.st_size}".encode())
+        return h.hexdigest()
+
+    def _write_result(self) -> None:
+        """Write the resolved data to textures.json as compact JSON."""
+        path = self.cache_dir / "textures.json"
+        if orjson is not None:
+            with open(path, "wb") as f:
+                f.write(orjson.dumps(self.result))
+            return
+
+        # Encode entry by entry rather than building the whole document in memory
+        encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+        with open(path, "w", encoding="utf8", buffering=1 << 20) as f:
+            f.write('{"models":{')
+            for i, (name, model) in enumerate(self.result["models"].items()):
+                f.write(f"{',' if i else ''}{encode(name)}:{encode(model)}")
+            f.write("}")
+            for name, blockstate in self.result.items():
+                if name != "models":
+                    f.write(f",{encode(name)}:{encode(blockstate)}")
+            f.write("}")
+
+    def _open_packs(self) -> None:
+        """Open all resource pack ZIPs concurrently and index their assets across packs."""
+        for pack_path in self.resource_packs:
+            if pack_path.suffix != ".zip":
                 raise ValueError(f"Unsupported resource pack format: {pack_path.suffix}")
+        if not self.resource_packs:
+            return
 
-    def _find_minecraft_path(self, base: str) -> Path:
-        """Navigate to the assets/minecraft directory within an extracted pack."""
-        path = Path(base)
-        if (path / "assets").exists():
-            return path / "assets" / "minecraft"
+        workers = min(len(self.resource_packs), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            futures = [ex.submit(self._open_pack, p) for p in self.resource_packs]
+
+        # Collect in submission order so left-most precedence is kept; gather every
+        # result before raising so successfully opened archives still get closed
+        error: BaseException | None = None
+        indexes: list[dict[str, dict[str, _Asset]]] = []
+        for future in futures:
+            try:
+                z, index = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            self._packs.append(z)
+            indexes.append(index)
+        if error is not None:
+            raise error
+
+        # Merge lowest priority first so the left-most pack's entries overwrite the rest;
+        # each name then maps straight to the single archive entry that wins
+        for index in reversed(indexes):
+            self._blockstates.update(index["blockstates"])
+            self._models.update(index["models"])
+            self._textures.update(index["textures"])
+
+    def _open_pack(self, pack_path: Path) -> tuple[zipfile.ZipFile, dict[str, dict[str, _Asset]]]:
+        """Open a single pack and index its assets by category and name."""
+        z = zipfile.ZipFile(pack_path, "r")
+        try:
+            infos = z.infolist()
+            prefix = self._find_minecraft_prefix([info.filename for info in infos], pack_path)
+            index: dict[str, dict[str, _Asset]] = {category: {} for category in _ASSET_TYPES}
+            for info in infos:
+                if not info.filename.startswith(prefix) or info.is_dir():
+                    continue
+                category, _, name = info.filename[len(prefix) :].partition("/")
+                ext = _ASSET_TYPES.get(category)
+                if ext is not None and name.endswith(ext):
+                    index[category][name[: -len(ext)]] = (z, info)
+            return z, index
+        except Exception:
+            z.close()
+            raise
+
+    def _find_minecraft_prefix(self, names: list[str], pack_path: Path) -> str:
+        """Find the archive prefix of the assets/minecraft directory within a pack."""
+        # Only assets/ has to exist; packs without assets/minecraft/ just contribute nothing
+        if any(name.startswith("assets/") for name in names):
+            return "assets/minecraft/"
         # Some zips have a wrapper directory
-        for child in path.iterdir():
-            if child.is_dir() and (child / "assets").exists():
-                return child / "assets" / "minecraft"
-        raise FileNotFoundError(f"Cannot find assets/minecraft in {base}")
+        for name in names:
+            head, sep, rest = name.partition("/")
+            if sep and rest.startswith("assets/"):
+                return f"{head}/assets/minecraft/"
+        raise FileNotFoundError(f"Cannot find assets/minecraft in {pack_path}")
 
     def _resolve_blocks(self) -> None:
         """Resolve blockstate + models for each needed block."""
-        blocks = sorted(self.block_names)
-        if self.show_progress:
-            with alive_bar(len(blocks), title="Resolving blocks") as bar:
-                for block_name in blocks:
-                    self._resolve_block(block_name)
-                    bar()
-        else:
-            for block_name in blocks:
-                self._resolve_block(block_name)
+        # Order only matters for a readable progress bar; results are keyed by name
+        blocks = sorted(self.block_names) if self.show_progress else list(self.block_names)
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as ex:
+            futures = [ex.submit(self._resolve_block, block_name) for block_name in blocks]
+            if self.show_progress:
+                with alive_bar(len(blocks), title="Resolving blocks") as bar:
+                    for future in as_completed(futures):
+                        future.result()
+                        bar()
+            else:
+                for future in as_completed(futures):
+                    future.result()
 
     def _resolve_block(self, block_name: str) -> None:
-        """Find blockstate for a block from the first available pack (left-to-right priority)."""
-        for mc_path, _ in self._extracted_packs:
-            blockstate_file = mc_path / "blockstates" / f"{block_name}.json"
-            if not blockstate_file.exists():
-                continue
-
-            with open(blockstate_file, "r", encoding="utf8") as f:
-                blockstate = json.load(f)
+        """Resolve a block's blockstate from the highest-priority pack that has it."""
+        asset = self._blockstates.get(block_name)
+        if asset is None:
+            return
 
-            # Resolve all referenced models
-            model_refs = self._extract_model_refs(blockstate)
-            for model_ref in model_refs:
-                self._resolve_model(model_ref)
+        with self._open_member(*asset) as f:
+            blockstate = _loads(f.read())
 
-            # Shorten model paths in blockstate for lookup
-            self._shorten_model_refs(blockstate)
+        # Shorten model paths in blockstate for lookup, then resolve the full references
+        self._resolve_models(_take_model_refs(blockstate))
+        with self._lock:
             self.result[block_name] = blockstate
-            return  # Found in this pack, stop searching
-
-    def _extract_model_refs(self, blockstate: dict) -> Set[str]:
-        """Collect all model references from a blockstate definition."""
-        refs: Set[str] = set()
-        if "variants" in blockstate:
-            for variant in blockstate["variants"].values():
-                if isinstance(variant, dict):
-                    refs.add(variant["model"])
-                elif isinstance(variant, list):
-                    for v in variant:
-                        refs.add(v["model"])
-        if "multipart" in blockstate:
-            for part in blockstate["multipart"]:
-                apply_data = part["apply"]
-                if isinstance(apply_data, dict):
-                    refs.add(apply_data["model"])
-                elif isinstance(apply_data, list):
-                    for a in apply_data:
-                        refs.add(a["model"])
-        return refs
-
-    def _resolve_model(self, model_ref: str) -> None:
-        """Resolve a model and its parent chain, copying referenced textures."""
-        model_path = model_ref.split(":")[-1]  # Remove "minecraft:" prefix
-        short_name = model_path.split("/")[-1]  # Just the filename without path
-
-        if short_name in self.result["models"]:
-            return  # Already resolved
-
-        for mc_path, _ in self._extracted_packs:
-            model_file = mc_path / "models" / f"{model_path}.json"
-            if not model_file.exists():
-                continue
 
-            with open(model_file, "r", encoding="utf8") as f:
-                raw_data = f.read()
-                model_data = json.loads(raw_data)
+    def _resolve_models(self, model_refs: set[str]) -> None:
+        """Resolve models and their parent chains, copying referenced textures."""
+        stack: list[str] = list(model_refs)
+        while stack:
+            model_path = stack.pop().rpartition(":")[2]  # Remove "minecraft:" prefix
+            short_name = model_path.rpartition("/")[2]  # Just the filename without path
 
-            # Recursively resolve parent model first
-            if "parent" in model_data:
-                self._resolve_model(model_data["parent"])
+            # Claim before reading so shared parents are parsed once per build
+            with self._lock:
+                if short_name in self._claimed_models:
+                    continue  # Already resolved or being resolved by another thread
+                self._claimed_models.add(short_name)
 
-            # Strip "minecraft:" prefixes from all references
-            cleaned = json.loads(raw_data.replace("minecraft:", ""))
+            cleaned = self._load_model(model_path)
+            if cleaned is None:
+                continue
+
+            # Queue the parent model
+            if "parent" in cleaned:
+                cleaned["parent"] = _strip_mc(cleaned["parent"])
+                stack.append(cleaned["parent"])
 
-            # Copy referenced texture PNGs
+            # Strip "minecraft:" prefixes from texture references and copy the PNGs
             if "textures" in cleaned:
-                for tex_ref in cleaned["textures"].values():
+                textures = cleaned["textures"]
+                for key, tex_ref in textures.items():
+                    tex_ref = textures[key] = _strip_mc(tex_ref)
                     if not tex_ref.startswith("#"):
                         self._copy_texture(tex_ref)
 
@@ -164,44 +344,122 @@ class TextureCacheBuilder:
                         if face in elem.get("faces", {}):
                             elem["faces"][face]["uv"] = [0, 0, 16, 8]
 
-            self.result["models"][short_name] = cleaned
-            return  # Found in this pack
+            with self._lock:
+                self.result["models"][short_name] = cleaned
+
+    def _load_model(self, model_path: str) -> dict[str, Any] | None:
+        """Read a model from the highest-priority pack that has it."""
+        asset = self._models.get(model_path)
+        if asset is None:
+            return None
+        with self._open_member(*asset) as f:
+            return _loads(f.read())
 
     def _copy_texture(self, tex_ref: str) -> None:
-        """Copy a texture PNG from the first pack that has it, maintaining directory structure."""
-        if tex_ref in self.copied_textures:
+        """Copy a texture PNG from the highest-priority pack, maintaining directory structure."""
+        with self._lock:
+            if tex_ref in self._claimed_textures:
+                return
+            self._claimed_textures.add(tex_ref)
+
+        asset = self._textures.get(tex_ref)
+        if asset is None:
             return
 
-        for mc_path, _ in self._extracted_packs:
-            tex_file = mc_path / "textures" / f"{tex_ref}.png"
-            if tex_file.exists():
-                dest = self.cache_dir / "textures" / f"{tex_ref}.png"
-                dest.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copy2(tex_file, dest)
-                self.copied_textures.add(tex_ref)
+        dest = self.cache_dir / "textures" / f"{tex_ref}.png"
+        parent = dest.parent
+        if parent not in self._made_dirs:
+            # Racing threads may both get here, which mkdir(exist_ok) tolerates
+            parent.mkdir(parents=True, exist_ok=True)
+            self._made_dirs.add(parent)
+        if asset[1].file_size < _DEDUP_MIN_SIZE:
+            with self._open_member(*asset) as src, open(dest, "wb") as dst:
+                self._stream_copy(src, dst)
+        else:
+            self._write_deduplicated(asset, dest)
+        with self._lock:
+            self.copied_textures.add(tex_ref)
+
+    def _write_deduplicated(self, asset: _Asset, dest: Path) -> None:
+        """Write a texture, hardlinking it to an earlier cache file with identical bytes."""
+        with self._open_member(*asset) as src:
+            data = src.read()
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        with self._lock:
+            existing = self._hash_to_dest.get(digest)
+
+        if existing is not None:
+            try:
+                os.link(existing, dest)
                 return
+            except OSError:
+                pass  # Filesystem without hardlink support, write a plain copy
+
+        with open(dest, "wb") as f:
+            f.write(data)
+        with self._lock:
+            self._hash_to_dest.setdefault(digest, dest)
+
+    @contextmanager
+    def _open_member(self, z: zipfile.ZipFile, info: zipfile.ZipInfo) -> Iterator[BinaryIO]:
+        """Open an archive member for reading from a worker thread."""
+        # ZipFile's open/close bookkeeping isn't atomic; decompression runs outside the lock
+        with self._lock:
+            f = z.open(info)
+        try:
+            yield f
+        finally:
+            with self._lock:
+                f.close()
+
+    def _stream_copy(self, src: BinaryIO, dst: BinaryIO) -> None:
+        """Copy src to dst through this thread's copy buffer, without copying file metadata."""
+        buf = getattr(self._local, "copy_buf", None)
+        if buf is None:
+            buf = self._local.copy_buf = bytearray(64 * 1024)
+        view = memoryview(buf)
+        while True:
+            n = src.readinto(buf)
+            if not n:
+                break
+            dst.write(view[:n])
+
+    def _build_atlas(self) -> None:
+        """Pack every copied texture of at most 64x64 into atlas.png and write its UV index."""
+        from PIL import Image  # Availability is checked in __init__
+
+        images: dict[str, Any] = {}
+        for tex_ref in sorted(self.copied_textures):  # Sorted for deterministic slots
+            with Image.open(self.cache_dir / "textures" / f"{tex_ref}.png") as img:
+                if img.width <= _ATLAS_MAX_SIZE and img.height <= _ATLAS_MAX_SIZE:
+                    images[tex_ref] = img.convert("RGBA")
+        if not images:
+            return
+
+        cell = max(max(img.width, img.height) for img in images.values())
+        columns = math.ceil(math.sqrt(len(images)))
+        rows = math.ceil(len(images) / columns)
+        width, height = columns * cell, rows * cell
+        atlas = Image.new("RGBA", (width, height))
+        index: dict[str, list[float]] = {}
+        for slot, (tex_ref, img) in enumerate(images.items()):
+            x0, y0 = (slot % columns) * cell, (slot // columns) * cell
+            atlas.paste(img, (x0, y0))
+            # Image rows run top-down, OBJ v runs bottom-up. The rect is inset by half a
+            # texel so filtered sampling at face edges never reaches the neighbouring slot.
+            index[tex_ref] = [
+                (x0 + 0.5) / width,
+                1 - (y0 + img.height - 0.5) / height,
+                (x0 + img.width - 0.5) / width,
+                1 - (y0 + 0.5) / height,
+            ]
 
-    def _shorten_model_refs(self, blockstate: dict) -> None:
-        """Replace full model paths with short names in blockstate data."""
-        if "variants" in blockstate:
-            for key in blockstate["variants"]:
-                variant = blockstate["variants"][key]
-                if isinstance(variant, dict):
-                    variant["model"] = variant["model"].split("/")[-1]
-                elif isinstance(variant, list):
-                    for v in variant:
-                        v["model"] = v["model"].split("/")[-1]
-        if "multipart" in blockstate:
-            for part in blockstate["multipart"]:
-                apply_data = part["apply"]
-                if isinstance(apply_data, dict):
-                    apply_data["model"] = apply_data["model"].split("/")[-1]
-                elif isinstance(apply_data, list):
-                    for a in apply_data:
-                        a["model"] = a["model"].split("/")[-1]
+        atlas.save(self.cache_dir / "atlas.png", optimize=True)
+        with open(self.cache_dir / "atlas_index.json", "w", encoding="utf8") as f:
+            json.dump(index, f, ensure_ascii=False)
 
     def _cleanup(self) -> None:
-        """Remove temporary extracted pack directories."""
-        for _, tmpdir in self._extracted_packs:
-            if tmpdir:
-                shutil.rmtree(tmpdir, ignore_errors=True)
+        """Close all opened resource pack archives."""
+        for z in self._packs:
+            z.close()
+        self._packs.clear()